@@ -2,12 +2,29 @@
 arXiv論文通知Bot - メイン実行ファイル
 ワークフローのみを記述し、詳細な処理は各サービスに委譲
 """
+import argparse
+import logging
+
 from src.config import Config
 from src.services import ArxivService, AIService, SlackService
 
 
+def parse_args() -> argparse.Namespace:
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description="arXiv論文通知Bot")
+    parser.add_argument(
+        "--rebuild-seen",
+        action="store_true",
+        help="Slackの最新スレッドと突き合わせて通知済み論文のインデックスを補完し、通知せずに終了する"
+    )
+    return parser.parse_args()
+
+
 def main():
     """メイン実行関数"""
+    args = parse_args()
+    # 各サービスのログ（INFO以上）を標準出力に表示する。DEBUGの詳細ログは出力しない
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
     try:
         # 設定の読み込み
         config = Config()
@@ -17,26 +34,39 @@ def main():
         ai_service = AIService(config)
         slack_service = SlackService(config, ai_service)
         
-        # メインワークフロー
-        print("🔍 arXiv論文を取得中...")
-        papers_by_tag = arxiv_service.fetch_arxiv_papers()
-        
-        # 今日の記事が見つかったかどうか
-        if not arxiv_service.has_papers(papers_by_tag):
-            print("No papers found for any tag.")
+        if args.rebuild_seen:
+            # 通知済み論文のインデックスをSlackの履歴から補完するだけの管理用コマンド
+            print("🔄 通知済み論文のインデックスをSlackの履歴と突き合わせ中...")
+            backfilled_ids = slack_service.rebuild_posted_index()
+            print(f"✅ {len(backfilled_ids)}件の通知済み論文を取り込みました。")
             return
         
-        # 優先順位に基づいて最適な論文を選択
-        print("📋 最適な論文を選択中...")
-        best_paper = arxiv_service.select_best_paper(papers_by_tag)
-        
-        if not best_paper:
-            print("No suitable paper found after priority filtering.")
-            return
+        # メインワークフロー
+        print("🔍 arXiv論文を取得中...")
+        if config.max_papers == 1:
+            # 1件だけ通知する場合は、優先順位順に取得して最初に見つかった時点で打ち切る
+            best_paper, _ = arxiv_service.fetch_first_available()
+            if not best_paper:
+                print("No papers found for any tag.")
+                return
+            papers = [best_paper]
+        else:
+            # 優先順位に基づいて選ばれた論文から順に、残りのタグの取得を待たずに翻訳を始める
+            print("📋 最適な論文を選択中...")
+            # 通知済みの論文は notify_papers で除かれるため、翻訳しない
+            papers = ai_service.prefetch_translations(
+                arxiv_service.iter_selected_papers(config.max_papers),
+                skip_ids=slack_service.posted_index.paper_ids()
+            )
+            
+            if not papers:
+                print("No papers found for any tag.")
+                return
         
         # 選択した論文をSlackに通知
-        print(f"📤 論文を通知中: {best_paper['title'][:50]}...")
-        success = slack_service.notify_paper(best_paper)
+        for paper in papers:
+            print(f"📤 論文を通知中: {paper['title'][:50]}...")
+        success = slack_service.notify_papers(papers)
         
         if success:
             print("✅ 論文の通知が完了しました。")
@@ -5,7 +5,29 @@
 import os
 import json
 from dotenv import load_dotenv, find_dotenv
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+
+
+# 設定ファイルのパス -> (読み込み時の更新時刻, 設定内容)
+_config_cache: Dict[str, Tuple[int, dict]] = {}
+
+
+def _read_config_file(config_file: str) -> dict:
+    """設定ファイルを読み込む（更新時刻が変わっていなければ前回の内容を返す）"""
+    try:
+        mtime = os.stat(config_file).st_mtime_ns
+    except FileNotFoundError:
+        _config_cache.pop(config_file, None)
+        return {}
+    
+    cached = _config_cache.get(config_file)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    
+    with open(config_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    _config_cache[config_file] = (mtime, data)
+    return data
 
 
 class Config:
@@ -25,12 +47,9 @@ class Config:
     
     def _load_config(self):
         """設定ファイルを読み込む"""
-        if os.path.exists(self.CONFIG_FILE):
-            with open(self.CONFIG_FILE, "r", encoding="utf-8") as f:
-                config_data = json.load(f)
-                self.tags = config_data.get("tags", ["cs.AI", "cs.LG", "cs.CL"])
-        else:
-            self.tags = ["cs.AI", "cs.LG", "cs.CL"]  # デフォルト値
+        config_data = _read_config_file(self.CONFIG_FILE)
+        # キャッシュされた設定を書き換えないようにコピーする
+        self.tags = list(config_data.get("tags", ["cs.AI", "cs.LG", "cs.CL"]))  # デフォルト値
         
         # タグの優先順位（配列の順番が優先順位を表す）
         self.tag_priority = self.tags.copy()
@@ -44,22 +63,53 @@ class Config:
         slack_channels = os.getenv("SLACK_CHANNELS", "")
         self.slack_channel_id = self._parse_slack_channels(slack_channels)
         
+        # 1回の実行で通知する論文の最大数（デフォルトは1件）
+        self.max_papers = self._parse_max_papers(os.getenv("MAX_PAPERS", "1"))
+        
+        # キャッシュの保存先ディレクトリ（翻訳結果などを実行間で再利用する）
+        self.cache_dir = os.getenv("CACHE_DIR", ".cache")
+        
+        # 翻訳キャッシュの有効期限（日数）
+        self.translation_cache_ttl_days = self._parse_int_env("TRANSLATION_CACHE_TTL_DAYS", 30)
+        
+        # arXivの取得結果を再利用する期間（秒）
+        self.arxiv_cache_ttl_seconds = self._parse_int_env("ARXIV_CACHE_TTL_SECONDS", 3600)
+        
         # Notion統合設定
         self.enable_notion = os.getenv("ENABLE_NOTION", "false").lower() == "true"
     
     def _parse_slack_channels(self, slack_channels: str) -> Optional[str]:
-        """Slackチャンネル設定を解析して単一チャンネルIDを取得"""
-        if not slack_channels:
-            return None
-        
-        pairs = slack_channels.split(",")
-        for pair in pairs:
-            parts = pair.split(":")
-            if len(parts) == 2:
-                key, channel_id = parts
-                if key.strip() == "all" or len(pairs) == 1:
-                    return channel_id.strip()
-        return None
+        """
+        Slackチャンネル設定（"キー:チャンネルID" のカンマ区切り）を解析して単一チャンネルIDを取得
+        
+        "all" キーがあればそのチャンネルを、なければ最初に指定されたチャンネルを使う
+        """
+        channels = {}
+        for pair in slack_channels.split(","):
+            key, sep, channel_id = pair.partition(":")
+            if sep and channel_id.strip():
+                channels.setdefault(key.strip(), channel_id.strip())
+        
+        return channels.get("all") or next(iter(channels.values()), None)
+    
+    def _parse_max_papers(self, value: str) -> int:
+        """通知する論文の最大数を解析する（不正な値の場合は1）"""
+        try:
+            return max(1, int(value))
+        except ValueError:
+            print(f"Warning: Invalid MAX_PAPERS value '{value}'. Using 1.")
+            return 1
+    
+    def _parse_int_env(self, name: str, default: int) -> int:
+        """0以上の整数の環境変数を解析する（未設定または不正な値の場合はデフォルト値）"""
+        value = os.getenv(name)
+        if value is None:
+            return default
+        try:
+            return max(0, int(value))
+        except ValueError:
+            print(f"Warning: Invalid {name} value '{value}'. Using {default}.")
+            return default
     
     def _validate_config(self):
         """設定の検証"""
@@ -78,13 +128,20 @@ class Config:
             print("Warning: Gemini API key is not set. Translation features will be disabled.")
     
     def update_tags(self, new_tags: List[str]) -> List[str]:
-        """タグを更新する"""
+        """タグを更新する（変更がない場合はファイルを書き換えない）"""
+        if new_tags == self.tags:
+            return self.tags
+        
         self.tags = new_tags
         self.tag_priority = new_tags.copy()
         
+        # 一時ファイルに書き込んでから置き換え、書き込み途中の設定ファイルを読まれないようにする
         config = {"tags": new_tags}
-        with open(self.CONFIG_FILE, "w", encoding="utf-8") as f:
+        tmp_file = f"{self.CONFIG_FILE}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
             json.dump(config, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_file, self.CONFIG_FILE)
+        _config_cache.pop(self.CONFIG_FILE, None)
         
         return self.tags
     
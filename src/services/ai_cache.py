@@ -0,0 +1,146 @@
+"""
+AI翻訳・要約結果のキャッシュ
+論文ごとの翻訳・要約結果をJSONファイルに永続化し、同じ論文でのAPI呼び出しを省く
+"""
+import logging
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from difflib import SequenceMatcher
+from typing import Dict, Any, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+# 近似一致とみなすアブストラクトの類似度のしきい値
+SIMILARITY_THRESHOLD = 0.95
+
+# arXiv IDのバージョン部分（例: 2401.01234v2 の "v2"）
+_VERSION_SUFFIX_RE = re.compile(r'v\d+$')
+
+
+class TranslationCache:
+    """翻訳・要約結果の永続キャッシュ（JSONファイル）"""
+    
+    def __init__(self, cache_file: str, model_name: str, prompt_version: int = 1, ttl_days: int = 30):
+        self.cache_file = cache_file
+        self.model_name = model_name
+        self.prompt_version = prompt_version
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        # 複数スレッドから同時に翻訳されるためロックで保護する
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self._rebuild_indexes()
+    
+    def get(self, paper: Dict[str, Any]) -> Optional[Dict[str, str]]:
+        """キャッシュ済みの翻訳・要約を取得する（なければNone）"""
+        with self._lock:
+            entry = self._entries.get(self._make_key(paper))
+            if entry is None:
+                entry = self._find_similar(paper)
+        return dict(entry["translation"]) if entry is not None else None
+    
+    def set(self, paper: Dict[str, Any], translation: Dict[str, str]):
+        """翻訳・要約をキャッシュに保存し、ファイルへ書き込む"""
+        key = self._make_key(paper)
+        entry = {
+            "model": self.model_name,
+            "prompt_version": self.prompt_version,
+            "paper_id": _base_paper_id(paper["id"]),
+            "summary": paper["summary"],
+            "translation": dict(translation),
+            "created_at": time.time()
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._index_entry(key, entry)
+            self._save()
+    
+    def _make_key(self, paper: Dict[str, Any]) -> str:
+        """モデル名・プロンプトのバージョン・論文ID・アブストラクトからキャッシュキーを生成する"""
+        raw = f"{self.model_name}\n{self.prompt_version}\n{paper['id']}\n{paper['summary']}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def _find_similar(self, paper: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        改訂版（v2, v3...）や表記ゆれ程度の違いしかない論文のキャッシュを探す
+        
+        正規化したアブストラクトが完全一致するもの、または同じarXiv IDで
+        アブストラクトの類似度がしきい値以上のものを近似一致とみなす
+        """
+        key = self._by_summary.get(_summary_digest(paper["summary"]))
+        if key is not None:
+            return self._entries[key]
+        
+        summary = paper["summary"]
+        for key in self._by_paper_id.get(_base_paper_id(paper["id"]), []):
+            entry = self._entries[key]
+            matcher = SequenceMatcher(None, summary, entry["summary"])
+            # quick_ratio() は ratio() の上限値なので、先に安価な判定で候補を絞る
+            if matcher.quick_ratio() >= SIMILARITY_THRESHOLD and matcher.ratio() >= SIMILARITY_THRESHOLD:
+                return entry
+        return None
+    
+    def _rebuild_indexes(self):
+        """近似一致検索用のインデックスを作り直す"""
+        self._by_paper_id = {}
+        self._by_summary = {}
+        for key, entry in self._entries.items():
+            self._index_entry(key, entry)
+    
+    def _index_entry(self, key: str, entry: Dict[str, Any]):
+        """エントリを近似一致検索用のインデックスに登録する"""
+        keys = self._by_paper_id.setdefault(entry["paper_id"], [])
+        if key not in keys:
+            keys.append(key)
+        self._by_summary[_summary_digest(entry["summary"])] = key
+    
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """キャッシュファイルを読み込む（期限切れや別のモデル・プロンプトのエントリは破棄する）"""
+        if not os.path.exists(self.cache_file):
+            return {}
+        
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load translation cache: %s", e)
+            return {}
+        
+        now = time.time()
+        return {
+            key: entry for key, entry in entries.items()
+            if isinstance(entry, dict) and "translation" in entry and
+            entry.get("model") == self.model_name and
+            entry.get("prompt_version") == self.prompt_version and
+            now - entry.get("created_at", 0) < self.ttl_seconds
+        }
+    
+    def _save(self):
+        """キャッシュを一時ファイル経由でアトミックに書き込む"""
+        cache_dir = os.path.dirname(self.cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logger.warning("Failed to save translation cache: %s", e)
+
+
+def _base_paper_id(paper_id: str) -> str:
+    """arXiv IDからバージョン部分を取り除く"""
+    return _VERSION_SUFFIX_RE.sub('', paper_id)
+
+
+def _summary_digest(summary: str) -> str:
+    """空白と大文字小文字の違いを無視したアブストラクトのハッシュ値"""
+    normalized = " ".join(summary.split()).lower()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
@@ -2,10 +2,138 @@
 AI翻訳・要約サービス
 Gemini APIを使用した論文の翻訳・要約機能
 """
-import re
-import google.generativeai as genai
-from typing import Dict, Any
+import logging
+import os
+import json
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, List, Optional, Set
+from typing_extensions import TypedDict
 from ..config.settings import Config
+from .ai_cache import TranslationCache
+
+
+logger = logging.getLogger(__name__)
+
+
+# 翻訳・要約に使用するGeminiモデル
+GEMINI_MODEL_NAME = 'gemini-2.0-flash-lite'
+
+# 翻訳・要約プロンプトのバージョン（プロンプトを変更したら上げて、キャッシュを無効化する）
+PROMPT_VERSION = 2
+
+# google.generativeai は protobuf/grpc を読み込むため起動が遅くなる。
+# APIキーが設定されていて実際に使うときまでインポートを遅らせる
+genai = None
+
+# 複数論文を同時に翻訳する際の最大ワーカー数
+MAX_TRANSLATION_WORKERS = 4
+
+# 1回のリクエストにまとめて翻訳する論文の最大数
+BATCH_SIZE = 4
+
+# 論文1件あたりに割り当てる出力トークン数（まとめて翻訳する際は件数倍する）
+# 日本語の要約（400〜600字）・タイトル・Q&A 5つのJSONは1件で1500トークン前後になるため、
+# 途中で打ち切られてJSONが壊れないよう余裕を持たせる
+MAX_OUTPUT_TOKENS_PER_PAPER = 2048
+
+# GEMINI_MODEL_NAME の1回のリクエストで出力できる最大トークン数
+MODEL_MAX_OUTPUT_TOKENS = 8192
+
+# 翻訳・要約のシステムプロンプト（固定にしてサーバー側のキャッシュを効かせる）
+_SYSTEM_PROMPT = (
+    "あなたは学術論文を日本語に翻訳・要約するアシスタントです。"
+    "指示されたJSON形式のみで回答してください。"
+)
+
+# 1件の論文を翻訳・要約するプロンプト（論文情報を format_map で埋め込む）
+# 内容を変更した場合は PROMPT_VERSION を上げる
+_PAPER_PROMPT_TEMPLATE = """以下の学術論文の情報を日本語に翻訳し、要約してください。
+
+論文タイトル: {title}
+著者: {authors}
+出版日: {published}
+
+アブストラクト:
+{summary}
+
+次の形式のJSONで出力してください:
+{{"translated_title": "日本語タイトル", "translated_summary": "400-600文字の日本語要約", "key_qa": [{{"question": "重要な質問", "answer": "その回答"}}]}}
+（key_qaには3-5個のQ&Aペアを含めてください）
+"""
+
+# まとめて翻訳する際の論文1件分のセクション
+_BATCH_PAPER_SECTION_TEMPLATE = """### 論文{index}
+論文タイトル: {title}
+著者: {authors}
+出版日: {published}
+
+アブストラクト:
+{summary}"""
+
+# 複数の論文をまとめて翻訳・要約するプロンプト
+_BATCH_PROMPT_TEMPLATE = """以下の{count}本の学術論文それぞれについて、情報を日本語に翻訳し、要約してください。
+
+{papers_text}
+
+論文の順番どおりに{count}個の要素を持つ、次の形式のJSON配列で出力してください:
+[{{"index": 論文番号, "translated_title": "日本語タイトル", "translated_summary": "400-600文字の日本語要約", "key_qa": [{{"question": "重要な質問", "answer": "その回答"}}]}}]
+（key_qaには3-5個のQ&Aペアを含めてください）
+"""
+
+
+# Q&Aの1組（レスポンススキーマ用）
+# google.generativeai はクラスのdocstringをスキーマの説明としてGeminiに送るため、説明はコメントに書く
+class _KeyQA(TypedDict):
+    question: str
+    answer: str
+
+
+# 1件の論文の翻訳・要約結果（レスポンススキーマ用）
+class _PaperTranslation(TypedDict):
+    translated_title: str
+    translated_summary: str
+    key_qa: List[_KeyQA]
+
+
+# まとめて翻訳した際の論文番号付きの結果（レスポンススキーマ用）
+class _IndexedPaperTranslation(_PaperTranslation):
+    index: int
+
+
+# まとめて翻訳する際のレスポンススキーマ
+# google.generativeai は配列のスキーマとして typing.List ではなく組み込みの list[...] を受け付ける
+_BATCH_RESPONSE_SCHEMA = list[_IndexedPaperTranslation]
+
+
+def _load_genai():
+    """google.generativeai を初回だけインポートし、以降はモジュール属性にキャッシュしたものを返す"""
+    global genai
+    if genai is None:
+        import google.generativeai
+        genai = google.generativeai
+    return genai
+
+
+def _strip_code_fence(text: str) -> str:
+    """応答が ```json ... ``` のようなコードブロックで囲まれている場合は中身だけを取り出す"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text
+
+
+def _is_transient_gemini_error(error: BaseException) -> bool:
+    """一時的なエラー（レート制限・サーバーエラー・タイムアウト）として再試行すべきかを判定する"""
+    from google.api_core import exceptions as google_exceptions
+    return isinstance(error, (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+    ))
 
 
 class AIService:
@@ -15,16 +143,31 @@ class AIService:
         self.config = config
         self.gemini_api_key = config.gemini_api_key
         
+        # 翻訳・要約結果のキャッシュ（論文のアブストラクトは不変のため再利用できる）
+        self.cache = TranslationCache(
+            os.path.join(config.cache_dir, "llm_cache.json"),
+            GEMINI_MODEL_NAME,
+            prompt_version=PROMPT_VERSION,
+            ttl_days=config.translation_cache_ttl_days
+        )
+        
         # API設定
         self._setup_gemini()
     
     def _setup_gemini(self):
         """Gemini APIの設定"""
+        # モデルは呼び出しごとに作らず、1件ずつの翻訳とまとめての翻訳で同じものを使い回す
+        self._model = None
         if self.gemini_api_key:
+            genai = _load_genai()
             genai.configure(api_key=self.gemini_api_key)
-            print("Using Gemini API for translation and summarization")
+            self._model = genai.GenerativeModel(
+                GEMINI_MODEL_NAME,
+                system_instruction=_SYSTEM_PROMPT
+            )
+            logger.info("Using Gemini API for translation and summarization")
         else:
-            print("Warning: Gemini API key is not set. Translation features will be disabled.")
+            logger.warning("Gemini API key is not set. Translation features will be disabled.")
     
     def translate_and_summarize_paper(self, paper: Dict[str, Any]) -> Dict[str, str]:
         """Gemini APIを使って論文を翻訳・要約する"""
@@ -35,81 +178,217 @@ class AIService:
                 "key_qa": "Gemini API key is not set. Key Q&A unavailable."
             }
         
-        return self._translate_and_summarize_paper_gemini(paper)
-    
-    def _translate_and_summarize_paper_gemini(self, paper: Dict[str, Any]) -> Dict[str, str]:
-        """Gemini APIを使って論文を翻訳・要約する"""
-        if not self.gemini_api_key:
+        # キャッシュ済みの結果があればAPIを呼ばずに返す
+        cached = self.cache.get(paper)
+        if cached is not None:
+            logger.debug("Using cached translation for paper %s", paper['id'])
+            return cached
+        
+        try:
+            result = self._translate_and_summarize_paper_gemini(paper)
+        except Exception as e:
+            logger.exception("Error translating and summarizing paper %s with Gemini", paper['id'])
             return {
                 "translated_title": paper["title"],
-                "translated_summary": "Gemini API key is not set. Translation unavailable.",
-                "key_qa": "Gemini API key is not set. Key Q&A unavailable."
+                "translated_summary": f"翻訳・要約中にエラーが発生しました: {str(e)}",
+                "key_qa": "重要なQ&Aは利用できません。"
             }
         
+        # 成功した結果のみキャッシュする（エラー時のフォールバックは保存しない）
+        self.cache.set(paper, result)
+        return result
+    
+    def translate_and_summarize_papers(self, papers: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """
+        複数の論文を翻訳・要約する（結果は入力と同じ順序）
+        
+        キャッシュにない論文はBATCH_SIZE件ずつ1回のリクエストにまとめ、
+        各バッチは並列に処理する
+        """
+        if not self.gemini_api_key or len(papers) <= 1:
+            return [self.translate_and_summarize_paper(paper) for paper in papers]
+        
+        # 同じ論文が複数含まれる場合は1回だけ翻訳し、結果を使い回す
+        unique_papers = list({paper["id"]: paper for paper in papers}.values())
+        if len(unique_papers) < len(papers):
+            translations = dict(zip(
+                (paper["id"] for paper in unique_papers),
+                self.translate_and_summarize_papers(unique_papers)
+            ))
+            return [translations[paper["id"]] for paper in papers]
+        
+        results = [self.cache.get(paper) for paper in papers]
+        missing = [i for i, result in enumerate(results) if result is None]
+        batches = [missing[i:i + BATCH_SIZE] for i in range(0, len(missing), BATCH_SIZE)]
+        if not batches:
+            return results
+        
+        max_workers = min(MAX_TRANSLATION_WORKERS, len(batches))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            translated = executor.map(
+                lambda indexes: self._translate_batch([papers[i] for i in indexes]),
+                batches
+            )
+            for indexes, batch_results in zip(batches, translated):
+                for i, result in zip(indexes, batch_results):
+                    results[i] = result
+        
+        return results
+    
+    def prefetch_translations(self, papers: Iterable[Dict[str, Any]], skip_ids: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """
+        論文を受け取りながらBATCH_SIZE件ずつ翻訳・要約を始めてキャッシュに載せ、受け取った論文のリストを返す
+        
+        論文の取得と翻訳を重ねて実行するためのもので、翻訳結果は
+        translate_and_summarize_papers でキャッシュから取り出す。
+        skip_ids に含まれる論文（通知済みの論文など）は翻訳しない
+        """
+        if not self.gemini_api_key:
+            return list(papers)
+        
+        skip_ids = skip_ids or set()
+        received = []
+        pending = []
+        futures = []
+        with ThreadPoolExecutor(max_workers=MAX_TRANSLATION_WORKERS) as executor:
+            for paper in papers:
+                received.append(paper)
+                if paper["id"] in skip_ids:
+                    continue
+                pending.append(paper)
+                if len(pending) >= BATCH_SIZE:
+                    futures.append((pending, executor.submit(self.translate_and_summarize_papers, pending)))
+                    pending = []
+            if pending:
+                futures.append((pending, executor.submit(self.translate_and_summarize_papers, pending)))
+        
+        # 先読みに失敗しても通知時にもう一度翻訳するため、ログに残すだけにする
+        for batch, future in futures:
+            try:
+                future.result()
+            except Exception:
+                logger.exception("Error prefetching translations for papers %s",
+                                 ", ".join(paper["id"] for paper in batch))
+        return received
+    
+    def _translate_batch(self, papers: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """複数の論文を1回のリクエストで翻訳・要約する（失敗時は1件ずつ翻訳し直す）"""
+        if len(papers) == 1:
+            return [self.translate_and_summarize_paper(papers[0])]
+        
         try:
-            # プロンプトを作成
-            prompt = f"""以下の学術論文の情報を日本語に翻訳し、要約してください。
-
-論文タイトル: {paper['title']}
-著者: {paper['authors']}
-出版日: {paper['published']}
-
-アブストラクト:
-{paper['summary']}
-
-以下の3つの部分に分けて出力してください:
-1. 日本語タイトル:
-（ここに日本語タイトルを記入）
-
-2. 日本語要約:
-（ここに400-600文字の日本語要約を記入）
-
-3. 重要なQ&A:
-Q1: （重要な質問1）
-A1: （その回答）
-Q2: （重要な質問2）
-A2: （その回答）
-（3-5個のQ&Aペアを作成してください）
-"""
-            
-            # Gemini APIを呼び出し
-            model = genai.GenerativeModel('gemini-2.0-flash-lite')
-            response = model.generate_content(prompt)
-            
-            # レスポンスから結果を取得
-            result = response.text
-            
-            return self._parse_ai_response(result, paper)
-            
+            results = self._translate_and_summarize_papers_gemini(papers)
         except Exception as e:
-            print(f"Error translating and summarizing paper with Gemini: {e}")
+            logger.warning("Error batch-translating %d papers with Gemini, "
+                           "falling back to per-paper requests: %s", len(papers), e)
+            return [self.translate_and_summarize_paper(paper) for paper in papers]
+        
+        for paper, result in zip(papers, results):
+            self.cache.set(paper, result)
+        return results
+    
+    def _translate_and_summarize_paper_gemini(self, paper: Dict[str, Any]) -> Dict[str, str]:
+        """Gemini APIを使って論文を翻訳・要約する（APIエラーは呼び出し元で処理する）"""
+        if not self.gemini_api_key:
             return {
                 "translated_title": paper["title"],
-                "translated_summary": f"翻訳・要約中にエラーが発生しました: {str(e)}",
-                "key_qa": "重要なQ&Aは利用できません。"
+                "translated_summary": "Gemini API key is not set. Translation unavailable.",
+                "key_qa": "Gemini API key is not set. Key Q&A unavailable."
             }
+        
+        # プロンプトを作成
+        prompt = _PAPER_PROMPT_TEMPLATE.format_map(paper)
+        
+        # Gemini APIを呼び出し（JSON形式で出力させ、自由文の解析を不要にする）
+        result = self._generate_content(
+            prompt,
+            _PaperTranslation,
+            max_output_tokens=MAX_OUTPUT_TOKENS_PER_PAPER
+        )
+        
+        return self._parse_ai_response(result, paper)
     
-    def _parse_ai_response(self, result: str, paper: Dict[str, Any]) -> Dict[str, str]:
-        """AI レスポンスを解析して各セクションを抽出"""
-        # 結果を解析（パターンマッチングで各セクションを抽出）
-        title_match = re.search(
-            r'1\.\s*日本語タイトル:\s*(.+?)(?=\n\n|\n2\.)', 
-            result, 
-            re.DOTALL
+    def _translate_and_summarize_papers_gemini(self, papers: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Gemini APIを使って複数の論文をまとめて翻訳・要約する（JSON形式で受け取る）"""
+        papers_text = "\n\n".join(
+            _BATCH_PAPER_SECTION_TEMPLATE.format_map(dict(paper, index=i))
+            for i, paper in enumerate(papers, 1)
         )
-        summary_match = re.search(
-            r'2\.\s*日本語要約:\s*(.+?)(?=\n\n|\n3\.)', 
-            result, 
-            re.DOTALL
+        
+        # プロンプトを作成
+        prompt = _BATCH_PROMPT_TEMPLATE.format_map({"count": len(papers), "papers_text": papers_text})
+        
+        # Gemini APIを呼び出し
+        result = self._generate_content(
+            prompt,
+            _BATCH_RESPONSE_SCHEMA,
+            max_output_tokens=min(MAX_OUTPUT_TOKENS_PER_PAPER * len(papers), MODEL_MAX_OUTPUT_TOKENS)
         )
-        qa_match = re.search(r'3\.\s*重要なQ&A:\s*(.+)', result, re.DOTALL)
         
-        translated_title = title_match.group(1).strip() if title_match else paper["title"]
-        translated_summary = summary_match.group(1).strip() if summary_match else "要約の生成に失敗しました。"
-        key_qa = qa_match.group(1).strip() if qa_match else "重要なQ&Aの生成に失敗しました。"
+        return self._parse_batch_response(result, papers)
+    
+    @retry(
+        retry=retry_if_exception(_is_transient_gemini_error),
+        stop=stop_after_attempt(5),
+        wait=wait_exponential_jitter(initial=1, max=30),
+        reraise=True
+    )
+    def _generate_content(self, prompt: str, response_schema: Any, max_output_tokens: Optional[int] = None) -> str:
+        """
+        Gemini APIでスキーマに沿ったJSON形式の応答をストリーミングで生成する
+        （一時的なエラーは指数バックオフで再試行）
+        """
+        generation_config = {"response_mime_type": "application/json", "response_schema": response_schema}
+        if max_output_tokens is not None:
+            generation_config["max_output_tokens"] = max_output_tokens
+        
+        # ストリーミングで受け取り、届いたチャンクから順にテキストを連結する
+        response = self._model.generate_content(prompt, generation_config=generation_config, stream=True)
+        return "".join(chunk.text for chunk in response if chunk.parts)
+    
+    def _parse_batch_response(self, result: str, papers: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """まとめて翻訳したJSONレスポンスを論文ごとの結果に分解する"""
+        items = json.loads(_strip_code_fence(result))
+        if not isinstance(items, list) or len(items) != len(papers):
+            raise ValueError(f"Expected a JSON array of {len(papers)} items")
+        
+        # index が付いていればそれに従って並べ直す
+        if all(isinstance(item, dict) and "index" in item for item in items):
+            items = sorted(items, key=lambda item: item["index"])
+        
+        return [self._to_translation(item, paper) for item, paper in zip(items, papers)]
+    
+    def _parse_ai_response(self, result: str, paper: Dict[str, Any]) -> Dict[str, str]:
+        """AI のJSONレスポンスを解析して各項目を取り出す"""
+        data = json.loads(_strip_code_fence(result))
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object")
+        return self._to_translation(data, paper)
+    
+    def _to_translation(self, data: Dict[str, Any], paper: Dict[str, Any]) -> Dict[str, str]:
+        """JSONの各項目を翻訳・要約結果の形式に変換する（欠けている項目は既定の文言にする）"""
+        translated_title = str(data.get("translated_title") or "").strip()
+        translated_summary = str(data.get("translated_summary") or "").strip()
+        key_qa = self._format_key_qa(data.get("key_qa"))
         
         return {
-            "translated_title": translated_title,
-            "translated_summary": translated_summary,
-            "key_qa": key_qa
+            "translated_title": translated_title or paper["title"],
+            "translated_summary": translated_summary or "要約の生成に失敗しました。",
+            "key_qa": key_qa or "重要なQ&Aの生成に失敗しました。"
         }
+    
+    def _format_key_qa(self, key_qa: Any) -> str:
+        """Q&Aの配列を「Q1: 質問」「A1: 回答」の行が交互に並ぶテキストに整形する"""
+        if not key_qa:
+            return ""
+        if isinstance(key_qa, str):
+            return key_qa.strip()
+        
+        lines = []
+        for i, qa in enumerate(key_qa, 1):
+            if isinstance(qa, dict):
+                lines.append(f"Q{i}: {str(qa.get('question', '')).strip()}")
+                lines.append(f"A{i}: {str(qa.get('answer', '')).strip()}")
+            else:
+                lines.append(str(qa).strip())
+        return "\n".join(lines)
@@ -0,0 +1,71 @@
+"""
+arXiv取得結果のキャッシュ
+タグごとの取得結果をJSONファイルに保存し、有効期限内の再実行ではarXivへの問い合わせを省く
+"""
+import logging
+import os
+import glob
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+# これより古いキャッシュファイルは有効期限に関係なく削除する（秒）
+PURGE_AGE = 24 * 60 * 60
+
+_CACHE_FILE_PREFIX = "arxiv_"
+
+
+class FetchCache:
+    """タグごとのarXiv取得結果のキャッシュ（タグごとのJSONファイル）"""
+    
+    def __init__(self, cache_dir: str, ttl_seconds: int = 3600):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self._purge()
+    
+    def get(self, tag: str) -> Optional[List[Dict[str, Any]]]:
+        """有効期限内のタグの取得結果を返す（なければNone）"""
+        try:
+            with open(self._cache_file(tag), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load arXiv cache for %s: %s", tag, e)
+            return None
+        
+        if not isinstance(entry, dict) or not isinstance(entry.get("papers"), list):
+            return None
+        if time.time() - entry.get("fetched_at", 0) >= self.ttl_seconds:
+            return None
+        return entry["papers"]
+    
+    def set(self, tag: str, papers: List[Dict[str, Any]]):
+        """タグの取得結果を一時ファイル経由でアトミックに書き込む"""
+        cache_file = self._cache_file(tag)
+        tmp_file = f"{cache_file}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": time.time(), "papers": papers}, f, ensure_ascii=False)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logger.warning("Failed to save arXiv cache for %s: %s", tag, e)
+    
+    def _cache_file(self, tag: str) -> str:
+        """タグのキャッシュファイルのパス"""
+        return os.path.join(self.cache_dir, f"{_CACHE_FILE_PREFIX}{tag.replace(os.sep, '_')}.json")
+    
+    def _purge(self):
+        """PURGE_AGE より古いキャッシュファイルを削除する"""
+        now = time.time()
+        for cache_file in glob.glob(os.path.join(self.cache_dir, f"{_CACHE_FILE_PREFIX}*.json")):
+            try:
+                if now - os.path.getmtime(cache_file) >= PURGE_AGE:
+                    os.remove(cache_file)
+            except OSError:
+                pass
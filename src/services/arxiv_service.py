@@ -2,9 +2,36 @@
 arXiv論文取得サービス
 arXivから論文を取得し、選択ロジックを提供する
 """
-import arxiv
-from typing import Dict, List, Optional, Any
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 from ..config.settings import Config
+from .arxiv_cache import FetchCache
+
+
+logger = logging.getLogger(__name__)
+
+
+# 並列取得時の最大ワーカー数
+# arXivへのリクエスト自体は arXiv の利用規約（3秒に1回まで）に従い1件ずつ行うため（_create_arxiv_client を参照）、
+# 並列化で重なるのはキャッシュの読み書きや結果の整形と、リクエストの待ち時間の管理に限られる
+MAX_FETCH_WORKERS = 8
+
+# 各カテゴリで取得する論文数
+PAPERS_PER_TAG = 1
+
+# 全タグをまとめて問い合わせる際に取得する最新論文の件数（1ページで受け取れる件数）
+# この中に含まれなかったタグだけ、タグごとに問い合わせ直す
+COMBINED_FETCH_RESULTS = 50
+
+# arxiv ライブラリは実際に取得するときまでインポートを遅らせる（_get_arxiv_client で設定）
+arxiv = None
+_arxiv_client = None
+_arxiv_client_lock = threading.Lock()
+# arXivへのリクエストを1件ずつ行うためのロック（再試行は同じスレッドから再入するためRLock）
+_arxiv_request_lock = threading.RLock()
 
 
 class ArxivService:
@@ -14,50 +41,174 @@ class ArxivService:
         self.config = config
         self.tags = config.tags
         self.tag_priority = config.tag_priority
+        
+        # タグごとの取得結果のキャッシュ（有効期限内の再実行ではarXivへ問い合わせない）
+        self.fetch_cache = FetchCache(config.cache_dir, config.arxiv_cache_ttl_seconds)
     
     def fetch_arxiv_papers(self) -> Dict[str, List[Dict[str, Any]]]:
-        """各タグにつき1つずつ最新の論文を取得する"""
-        all_papers = {}
-
-        for tag in self.tags:
-            try:
-                # 日付フィルタなしで、最新の論文を取得（各タグ1件のみ）
-                query = f"cat:{tag}"
-                
-                # 最新バージョンのarxivライブラリに対応
-                search = arxiv.Search(
-                    query=query,
-                    max_results=1,  # 各カテゴリで最大1件取得
-                    sort_by=arxiv.SortCriterion.SubmittedDate,
-                    sort_order=arxiv.SortOrder.Descending
-                )
-                
-                papers = list(search.results())
-                formatted_papers = []
-                
-                for paper in papers:
-                    # 論文情報を整形（最新バージョンに対応）
-                    paper_info = {
-                        "id": paper.entry_id.split('/')[-1],  # get_short_id()の代替
-                        "title": paper.title,
-                        "url": paper.entry_id,
-                        "authors": ", ".join([author.name for author in paper.authors]),
-                        "published": paper.published.strftime("%Y-%m-%d") if paper.published else "Unknown",
-                        "summary": paper.summary,
-                        "pdf_url": paper.pdf_url,
-                        "tag": tag  # タグ情報を追加
-                    }
-                    formatted_papers.append(paper_info)
-                
+        """各タグにつき1つずつ最新の論文を取得する（タグごとに並列取得）"""
+        # 結果の並びをタグの順序に揃えるため、先にキーを用意しておく
+        all_papers = {tag: [] for tag in self.tags}
+        if not self.tags:
+            return all_papers
+        
+        self._prefetch_combined()
+        max_workers = min(MAX_FETCH_WORKERS, len(self.tags))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self._fetch_one, tag) for tag in self.tags]
+            for future in as_completed(futures):
+                tag, formatted_papers = future.result()
                 all_papers[tag] = formatted_papers
-                # デバッグ出力を追加
-                print(f"Found {len(formatted_papers)} papers for category {tag}")
-            except Exception as e:
-                print(f"Error fetching papers for tag {tag}: {e}")
-                all_papers[tag] = []
         
         return all_papers
     
+    def iter_selected_papers(self, limit: int = 1) -> Iterator[Dict[str, Any]]:
+        """
+        全タグを並列に取得し、select_papers と同じ優先順位で選ばれる論文を確定した順に返す
+        
+        上位のタグの取得が終われば、下位のタグの取得を待たずにその論文を返す
+        （呼び出し側は残りのタグを取得している間に翻訳などを始められる）。
+        まとめての問い合わせ（_prefetch_combined）は最初の論文を返す前に終えるため、
+        重ねて実行できるのは、そこで見つからずタグごとに問い合わせ直すタグの取得に限られる
+        """
+        fetched = {}
+        seen_ids = set()
+        selected = 0
+        next_index = 0
+        
+        if limit <= 0:
+            return
+        
+        self._prefetch_combined()
+        max_workers = min(MAX_FETCH_WORKERS, max(len(self.tags), 1))
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [executor.submit(self._fetch_one, tag) for tag in self.tags]
+            for future in as_completed(futures):
+                tag, formatted_papers = future.result()
+                fetched[tag] = formatted_papers
+                
+                # 優先順位の高い方から、取得済みのタグが続く範囲で選択を確定させる
+                while next_index < len(self.tag_priority) and self.tag_priority[next_index] in fetched:
+                    for paper in fetched[self.tag_priority[next_index]]:
+                        if paper["id"] in seen_ids:
+                            continue
+                        seen_ids.add(paper["id"])
+                        selected += 1
+                        yield paper
+                        if selected >= limit:
+                            # 必要な件数がそろったら、残りのタグの取得を待たずに終える
+                            return
+                    next_index += 1
+        finally:
+            # まだ始まっていない取得は取り消し、実行中の取得の完了も待たない
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def fetch_first_available(self) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        優先順位の高いタグから順に取得し、最初に見つかった論文を返す
+        
+        1件だけ通知する場合は、上位のタグで論文が見つかれば残りのタグへの
+        問い合わせを省ける（全タグを並列取得するより問い合わせ回数が少ない）
+        
+        Returns:
+            tuple: (論文, タグ)。どのタグにも論文がなければ (None, None)
+        """
+        for tag in self.tag_priority:
+            _, papers = self._fetch_one(tag)
+            if papers:
+                return papers[0], tag
+        return None, None
+    
+    def _prefetch_combined(self):
+        """
+        キャッシュにないタグを1回の問い合わせ（cat:A OR cat:B ...）でまとめて取得し、キャッシュに載せる
+        
+        結果は新しい順に並ぶため、各タグについて最初に見つかった論文が
+        タグごとに問い合わせた場合の最新論文と一致する。見つからなかったタグは
+        キャッシュに載らず、_fetch_one でタグごとに問い合わせる
+        """
+        tags = [tag for tag in self.tags if self.fetch_cache.get(tag) is None]
+        # 1タグだけならタグごとの問い合わせと回数が変わらない
+        if len(tags) <= 1:
+            return
+        
+        papers_by_tag = {tag: [] for tag in tags}
+        try:
+            client = _get_arxiv_client()
+            search = arxiv.Search(
+                query=" OR ".join(f"cat:{tag}" for tag in tags),
+                max_results=COMBINED_FETCH_RESULTS,
+                sort_by=arxiv.SortCriterion.SubmittedDate,
+                sort_order=arxiv.SortOrder.Descending
+            )
+            for paper in client.results(search):
+                # クロスリストされた論文は登録されている各タグに振り分ける
+                for tag in tags:
+                    if tag in paper.categories and len(papers_by_tag[tag]) < PAPERS_PER_TAG:
+                        papers_by_tag[tag].append(self._format_paper(paper, tag))
+                if all(len(papers) >= PAPERS_PER_TAG for papers in papers_by_tag.values()):
+                    break
+        except Exception:
+            logger.exception("Error fetching papers for tags %s", ", ".join(tags))
+            return
+        
+        for tag, formatted_papers in papers_by_tag.items():
+            if formatted_papers:
+                self.fetch_cache.set(tag, formatted_papers)
+        found = sum(1 for papers in papers_by_tag.values() if papers)
+        logger.debug("Found papers for %d/%d categories in a combined query", found, len(tags))
+    
+    def _fetch_one(self, tag: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """1つのタグについて最新の論文を取得する（失敗時は空リスト）"""
+        # 有効期限内の取得結果があればarXivへ問い合わせずに返す
+        cached = self.fetch_cache.get(tag)
+        if cached is not None:
+            logger.debug("Using cached papers for category %s", tag)
+            return tag, cached
+        
+        try:
+            # 必要な件数を受け取った時点で打ち切り、それ以上のページ取得を発生させない
+            formatted_papers = list(islice(self.iter_papers(tag), PAPERS_PER_TAG))
+            self.fetch_cache.set(tag, formatted_papers)
+            logger.debug("Found %d papers for category %s", len(formatted_papers), tag)
+            return tag, formatted_papers
+        except Exception:
+            logger.exception("Error fetching papers for tag %s", tag)
+            return tag, []
+    
+    def iter_papers(self, tag: str) -> Iterator[Dict[str, Any]]:
+        """1つのタグについて最新の論文を取得し、整形済みの論文情報を順に返す"""
+        # 日付フィルタなしで、最新の論文を取得
+        query = f"cat:{tag}"
+        
+        client = _get_arxiv_client()
+        
+        # 最新バージョンのarxivライブラリに対応（Search.results() は非推奨）
+        search = arxiv.Search(
+            query=query,
+            max_results=PAPERS_PER_TAG,  # 各カテゴリで取得する最大件数
+            sort_by=arxiv.SortCriterion.SubmittedDate,
+            sort_order=arxiv.SortOrder.Descending
+        )
+        
+        # 全件をリスト化せず、取得できたものから順に整形して返す
+        for paper in client.results(search):
+            yield self._format_paper(paper, tag)
+    
+    def _format_paper(self, paper: "arxiv.Result", tag: str) -> Dict[str, Any]:
+        """論文情報を整形する（最新バージョンに対応）"""
+        return {
+            "id": paper.entry_id.split('/')[-1],  # get_short_id()の代替
+            "title": paper.title,
+            "url": paper.entry_id,
+            "authors": ", ".join([author.name for author in paper.authors]),
+            "published": paper.published.strftime("%Y-%m-%d") if paper.published else "Unknown",
+            "summary": paper.summary,
+            "pdf_url": paper.pdf_url,
+            "tag": tag  # タグ情報を追加
+        }
+    
     def select_best_paper(self, papers_by_tag: Dict[str, List[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
         """
         優先順位の高いカテゴリから順に論文を探し、最も優先度の高い論文を返す
@@ -73,6 +224,72 @@ class ArxivService:
                 return papers_by_tag[tag][0]  # 各タグの最初の論文を返す
         return None
     
+    def select_papers(self, papers_by_tag: Dict[str, List[Dict[str, Any]]], limit: int = 1) -> List[Dict[str, Any]]:
+        """
+        優先順位の高いカテゴリから順に、最大limit件の論文を選択する
+        
+        Args:
+            papers_by_tag (dict): タグごとの論文リスト
+            limit (int): 選択する論文の最大数
+        
+        Returns:
+            list: 優先順位順に並んだ論文のリスト（同じ論文は含まない）
+        """
+        selected = []
+        # 複数カテゴリに登録された論文（クロスリスト）は最初に見つかったタグで1回だけ選ぶ
+        seen_ids = set()
+        for tag in self.tag_priority:
+            for paper in papers_by_tag.get(tag, []):
+                if len(selected) >= limit:
+                    return selected
+                if paper["id"] in seen_ids:
+                    continue
+                seen_ids.add(paper["id"])
+                selected.append(paper)
+        return selected
+    
     def has_papers(self, papers_by_tag: Dict[str, List[Dict[str, Any]]]) -> bool:
         """論文が存在するかチェック"""
         return any(len(papers) > 0 for papers in papers_by_tag.values())
+
+
+def _get_arxiv_client() -> "arxiv.Client":
+    """
+    全タグの取得で共有するarXivクライアントを返す（初回呼び出し時に arxiv をインポートして作成する）
+    
+    内部のrequests.Sessionとリクエスト間隔の管理（delay_seconds）を1つのクライアントにまとめる。
+    1回のリクエストで要求する件数は、検索ごとの max_results に合わせる（_create_arxiv_client を参照）
+    """
+    global arxiv, _arxiv_client
+    # 複数スレッドから同時に呼ばれるため、作成はロックの中で1回だけ行う
+    with _arxiv_client_lock:
+        if _arxiv_client is None:
+            import arxiv as arxiv_module
+            arxiv = arxiv_module
+            _arxiv_client = _create_arxiv_client()
+        return _arxiv_client
+
+
+def _create_arxiv_client() -> "arxiv.Client":
+    """検索ごとのページサイズで、リクエストを1件ずつ間隔を空けて問い合わせるarXivクライアントを作成する"""
+    
+    class _SharedClient(arxiv.Client):
+        """
+        1回のリクエストで検索の残り件数（max_results）を超える件数を要求せず、
+        複数スレッドから呼ばれてもリクエストの間隔（delay_seconds）を守るクライアント
+        """
+        
+        def _format_url(self, search: "arxiv.Search", start: int, page_size: int) -> str:
+            # arxiv はリクエストごとに page_size 件を要求するため、タグごとの取得（1件）で
+            # まとめて問い合わせる用のページサイズ分（COMBINED_FETCH_RESULTS 件）を受け取らないようにする
+            if search.max_results:
+                page_size = max(1, min(page_size, search.max_results - start))
+            return super()._format_url(search, start, page_size)
+        
+        def _parse_feed(self, url: str, first_page: bool = True, _try_index: int = 0):
+            # arxiv は前回のリクエスト時刻の確認・待機・更新をロックなしで行うため、並列に取得する
+            # スレッドが同じ時刻を見て同時にリクエストしてしまう。ロックの中で1件ずつ問い合わせる
+            with _arxiv_request_lock:
+                return super()._parse_feed(url, first_page=first_page, _try_index=_try_index)
+    
+    return _SharedClient(page_size=COMBINED_FETCH_RESULTS, delay_seconds=3.0, num_retries=3)
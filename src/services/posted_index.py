@@ -0,0 +1,42 @@
+"""
+通知済み論文のインデックス
+Slackへ通知した論文IDをSQLiteに記録し、重複チェックをローカルで行う
+"""
+import os
+import sqlite3
+import time
+from typing import Iterable, Set
+
+
+class PostedIndex:
+    """通知済み論文IDのローカルインデックス（SQLite）"""
+    
+    def __init__(self, db_file: str):
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        
+        self.db_file = db_file
+        self._conn = sqlite3.connect(db_file)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS posted(paper_id TEXT PRIMARY KEY, posted_at INTEGER)"
+        )
+        self._conn.commit()
+    
+    def paper_ids(self) -> Set[str]:
+        """通知済みの論文IDをすべて取得する"""
+        rows = self._conn.execute("SELECT paper_id FROM posted")
+        return {paper_id for (paper_id,) in rows}
+    
+    def add(self, paper_ids: Iterable[str]):
+        """論文IDを通知済みとして記録する（既に記録済みのものは無視）"""
+        posted_at = int(time.time())
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO posted(paper_id, posted_at) VALUES (?, ?)",
+            [(paper_id, posted_at) for paper_id in paper_ids]
+        )
+        self._conn.commit()
+    
+    def close(self):
+        """データベース接続を閉じる"""
+        self._conn.close()
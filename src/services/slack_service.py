@@ -2,15 +2,158 @@
 Slack通知サービス
 Slackへのメッセージ送信、履歴管理、重複チェック機能
 """
-import re
-from datetime import datetime
-from typing import Dict, Any, Optional, Set
+import logging
+import os
+import time
+import socket
+import threading
+from urllib.error import URLError
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Set, Tuple
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
+from slack_sdk.web import SlackResponse
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
 
 from ..config.settings import Config
 from ..utils.formatters import format_latex_for_slack
 from .ai_service import AIService
+from .posted_index import PostedIndex
+
+
+logger = logging.getLogger(__name__)
+
+
+# 同一チャンネルへの最小投稿間隔（秒）。Slackは1チャンネルあたり約1件/秒に制限している
+MIN_POST_INTERVAL = 1.05
+
+# レート制限（ratelimited）時の最大リトライ回数と、Retry-Afterがない場合の待機秒数
+MAX_RATE_LIMIT_RETRIES = 3
+DEFAULT_RETRY_AFTER = 1
+
+# 親投稿（スレッドの開始投稿）の本文の先頭に付ける目印
+_PARENT_PREFIX = "📢 *最新のarXiv論文"
+
+# 通知済みの論文を探すときに遡るSlackの履歴の日数
+# （定期実行は月曜と金曜のため、金曜から月曜までの間隔をカバーする）
+HISTORY_LOOKBACK_DAYS = 4
+
+# 1つのメッセージにまとめる論文の最大数（Slackの上限50ブロックを、論文ごとのセクション+区切り線で割った数）
+PAPERS_PER_MESSAGE = 25
+
+# 論文1件分のメッセージ本文のテンプレート（翻訳・要約あり）
+_PAPER_TEXT_TEMPLATE = (
+    "*【タイトル】*\n{translated_title}\n\n"
+    "*【原題】*\n{title}\n\n"
+    "*【公開日】*\n{published}\n\n"
+    "*【URL】*\n{url}\n\n"
+    "*【重要なポイント】*\n{key_qa}\n\n"
+    "*【要約】*\n{translated_summary}"
+)
+
+# 翻訳・要約の準備に失敗した場合のメッセージ本文のテンプレート（元の論文情報のみ）
+_FALLBACK_TEXT_TEMPLATE = (
+    "*【タイトル】*\n{title}\n\n"
+    "*【公開日】*\n{published}\n\n"
+    "*【URL】*\n{url}\n\n"
+    "*【要約】*\n{summary}"
+)
+
+# 投稿済みメッセージでURLの直前に置かれる区切り（"🔗 *URL:* http://..." と "タイトル - http://..."）
+_URL_LABEL = "URL:"
+_TITLE_URL_SEPARATOR = " - "
+
+
+def _is_parent_message(message: Dict[str, Any]) -> bool:
+    """Botの親投稿（「最新のarXiv論文」で始まるスレッドの開始投稿）かどうか"""
+    return message.get('text', '').startswith(_PARENT_PREFIX) and \
+        message.get('thread_ts', message.get('ts')) == message.get('ts')
+
+
+def _extract_paper_urls(text: str) -> List[str]:
+    """
+    投稿済みメッセージの本文から論文のURLを抽出する（1行に1件）
+    
+    Slackは投稿時にURLを <http://...> や <http://...|ラベル> の形式に変換するため、
+    前後の記号とラベルを取り除く
+    """
+    urls = []
+    for line in text.splitlines():
+        _, sep, tail = line.partition(_URL_LABEL)
+        url = _url_at_start(tail) if sep else None
+        if url is None:
+            # 翻訳タイトルに "URL:" や " - " が含まれる場合があるため、最後の " - " で分ける
+            _, sep, tail = line.rpartition(_TITLE_URL_SEPARATOR)
+            url = _url_at_start(tail) if sep else None
+        if url is not None:
+            urls.append(url)
+    return urls
+
+
+def _url_at_start(text: str) -> Optional[str]:
+    """区切りの直後の文字列がURLで始まっていれば、そのURLを返す（なければNone）"""
+    words = text.lstrip("* ").split(None, 1)
+    if not words:
+        return None
+    url = words[0].strip("<>\"*").split("|", 1)[0]
+    return url if url.startswith(("http://", "https://")) else None
+
+
+def _is_transient_slack_error(exception: BaseException) -> bool:
+    """再試行すべき一時的なエラー（Slack側のサーバーエラーや通信エラー）かどうか"""
+    if isinstance(exception, SlackApiError):
+        return exception.response.status_code >= 500
+    return isinstance(exception, (URLError, socket.timeout, ConnectionError))
+
+
+# Slack APIの一時的なエラーに対する再試行ポリシー（指数バックオフ+ジッター）
+_retry_transient_slack_errors = retry(
+    retry=retry_if_exception(_is_transient_slack_error),
+    stop=stop_after_attempt(5),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    reraise=True
+)
+
+
+class SlackSender:
+    """チャンネルごとに投稿間隔を調整してメッセージを送信する"""
+    
+    def __init__(self, client: WebClient, min_interval: float = MIN_POST_INTERVAL):
+        self.client = client
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last_post_at: Dict[str, float] = {}
+    
+    def post_message(self, channel: str, **kwargs) -> SlackResponse:
+        """chat_postMessage を投稿間隔を守って呼び出す（レート制限時は待ってから再送）"""
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            self._wait_for_slot(channel)
+            try:
+                return self._post(channel, **kwargs)
+            except SlackApiError as e:
+                if e.response.get("error") != "ratelimited" or attempt >= MAX_RATE_LIMIT_RETRIES:
+                    raise
+                retry_after = int(e.response.headers.get("Retry-After", DEFAULT_RETRY_AFTER))
+                logger.warning("Slack rate limit reached. Retrying in %ds...", retry_after)
+                time.sleep(retry_after)
+    
+    @_retry_transient_slack_errors
+    def _post(self, channel: str, **kwargs) -> SlackResponse:
+        """chat_postMessage を呼び出す（一時的なエラーは指数バックオフで再試行）"""
+        return self.client.chat_postMessage(channel=channel, **kwargs)
+    
+    def _wait_for_slot(self, channel: str):
+        """前回の投稿から最小投稿間隔が経過するまで待機する"""
+        with self._lock:
+            now = time.monotonic()
+            last_post_at = self._last_post_at.get(channel)
+            if last_post_at is not None:
+                wait = self.min_interval - (now - last_post_at)
+                if wait > 0:
+                    time.sleep(wait)
+                    now = time.monotonic()
+            self._last_post_at[channel] = now
 
 
 class SlackService:
@@ -21,139 +164,203 @@ class SlackService:
         self.ai_service = ai_service
         self.slack_channel_id = config.slack_channel_id
         self.client = WebClient(token=config.slack_token)
+        self.sender = SlackSender(self.client)
+        self.posted_index = PostedIndex(os.path.join(config.cache_dir, "posted.sqlite"))
     
     def notify_paper(self, paper: Dict[str, Any]) -> bool:
         """論文をSlackに通知する"""
+        return self.notify_papers([paper])
+    
+    def notify_papers(self, papers: List[Dict[str, Any]]) -> bool:
+        """複数の論文を1つのスレッドにまとめてSlackに通知する"""
         if not self.slack_channel_id:
-            print("❌ Error: Slack channel ID is not set.")
+            logger.error("Slack channel ID is not set.")
             return False
         
-        # 最新の親投稿から投稿された論文のURLを取得
-        latest_paper_urls = self._get_latest_parent_paper_urls()
-        
-        # 選択した論文が既に通知済みかチェック
-        if paper["url"] in latest_paper_urls:
-            print(f"論文 {paper['id']} は既に通知済みです。スキップします。")
+        # ローカルのインデックスで通知済みの論文を除く
+        posted_ids = self.posted_index.paper_ids()
+        candidates = self._filter_unposted(papers, posted_ids)
+        if not candidates:
             return False
         
-        try:
-            # 今日の新規親投稿を作成し、スレッドを開始
-            parent_response = self.client.chat_postMessage(
-                channel=self.slack_channel_id,
-                text=f"📢 *最新のarXiv論文 - {datetime.now().strftime('%Y-%m-%d')}*"
-            )
-            thread_ts = parent_response['ts']
+        # 翻訳・要約（数秒かかる）と、Slackの履歴との突き合わせ・親投稿は互いに独立しているため、並行して行う
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            translation_future = executor.submit(self.ai_service.translate_and_summarize_papers, candidates)
+            
+            # 突き合わせで通知済みと分かった論文は、翻訳結果ごと除く
+            backfilled_ids = self._backfill_posted_paper_ids(posted_ids)
+            new_papers = self._filter_unposted(candidates, backfilled_ids)
+            if not new_papers:
+                return False
             
-            # 選択した論文を通知
-            self._send_message_to_slack(
+            try:
+                # 今日の新規親投稿を作成し、スレッドを開始
+                parent_response = self.sender.post_message(
+                    channel=self.slack_channel_id,
+                    text=f"{_PARENT_PREFIX} - {datetime.now().strftime('%Y-%m-%d')}*"
+                )
+            except SlackApiError as e:
+                logger.error("Error sending parent message: %s", e.response['error'])
+                return False
+            
+            thread_ts = parent_response['ts']
+            translations_by_id = {
+                paper["id"]: translation
+                for paper, translation in zip(candidates, translation_future.result())
+            }
+            translations = [translations_by_id[paper["id"]] for paper in new_papers]
+        
+        # 選択した論文を1つのメッセージにまとめて通知（ブロック数の上限を超える場合は分割）
+        for i in range(0, len(new_papers), PAPERS_PER_MESSAGE):
+            chunk = new_papers[i:i + PAPERS_PER_MESSAGE]
+            ts = self._send_message_to_slack(
                 channel_id=self.slack_channel_id,
-                paper=paper,
+                papers=chunk,
+                translations=translations[i:i + PAPERS_PER_MESSAGE],
                 thread_ts=thread_ts
             )
-            
-            return True
-            
+            if ts:
+                self.posted_index.add([paper["id"] for paper in chunk])
+        
+        return True
+    
+    def _send_message_to_slack(self, channel_id: str, papers: List[Dict[str, Any]], translations: List[Optional[Dict[str, str]]], thread_ts: Optional[str] = None) -> Optional[str]:
+        """複数の論文を1つのSlackメッセージ（論文ごとのセクションを区切り線で区切る）として送信する"""
+        text_lines = []
+        blocks = []
+        for paper, translation in zip(papers, translations):
+            text_fallback, section = self._build_paper_section(paper, translation)
+            if blocks:
+                blocks.append({"type": "divider"})
+            blocks.append(section)
+            text_lines.append(text_fallback)
+        
+        try:
+            response = self.sender.post_message(
+                channel=channel_id,
+                text="\n".join(text_lines),
+                blocks=blocks,
+                thread_ts=thread_ts
+            )
+            logger.debug("Message sent: %s", response['ts'])
+            return response['ts']
         except SlackApiError as e:
-            print(f"Error sending parent message: {e.response['error']}")
-            return False
+            logger.error("Error sending message: %s", e.response['error'])
+            return None
     
-    def _send_message_to_slack(self, channel_id: str, paper: Dict[str, Any], thread_ts: Optional[str] = None) -> Optional[str]:
-        """Slack にメッセージを送信する"""
-        # 論文の翻訳・要約を取得
+    def _build_paper_section(self, paper: Dict[str, Any], translation: Optional[Dict[str, str]] = None) -> Tuple[str, Dict[str, Any]]:
+        """論文1件分のフォールバック用テキストとセクションブロックを作成する"""
         try:
-            translation = self.ai_service.translate_and_summarize_paper(paper)
+            # 翻訳・要約が渡されていない場合はここで取得
+            if translation is None:
+                translation = self.ai_service.translate_and_summarize_paper(paper)
             
             # text フィールドも付与（フォールバック用）
             text_fallback = f"{translation['translated_title']} - {paper['url']}"
             
             # 数式表記のクリーニング（LaTeX形式の数式を適切に表示）
-            title = format_latex_for_slack(paper['title'])
-            translated_title = format_latex_for_slack(translation['translated_title'])
-            translated_summary = format_latex_for_slack(translation['translated_summary'])
-            key_qa = format_latex_for_slack(translation['key_qa'])
-            
-            # Slack用に改行とフォーマットを改善したブロック
-            blocks = [
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": f"*【タイトル】*\n{translated_title}\n\n*【原題】*\n{title}\n\n*【公開日】*\n{paper['published']}\n\n*【URL】*\n{paper['url']}\n\n*【重要なポイント】*\n{key_qa}\n\n*【要約】*\n{translated_summary}"
-                    }
-                }
-            ]
-        except Exception as e:
-            print(f"Error preparing message: {e}")
+            text = _PAPER_TEXT_TEMPLATE.format_map({
+                "translated_title": format_latex_for_slack(translation['translated_title']),
+                "title": format_latex_for_slack(paper['title']),
+                "published": paper['published'],
+                "url": paper['url'],
+                "key_qa": format_latex_for_slack(translation['key_qa']),
+                "translated_summary": format_latex_for_slack(translation['translated_summary'])
+            })
+        except Exception:
+            logger.exception("Error preparing message for paper %s", paper['id'])
             # エラーが発生した場合は元の論文情報のみを表示
             text_fallback = f"{paper['title']} - {paper['url']}"
             
-            title = format_latex_for_slack(paper['title'])
-            summary = format_latex_for_slack(paper['summary'])
-            
-            blocks = [
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": f"*【タイトル】*\n{title}\n\n*【公開日】*\n{paper['published']}\n\n*【URL】*\n{paper['url']}\n\n*【要約】*\n{summary}"
-                    }
-                }
-            ]
+            text = _FALLBACK_TEXT_TEMPLATE.format_map({
+                "title": format_latex_for_slack(paper['title']),
+                "published": paper['published'],
+                "url": paper['url'],
+                "summary": format_latex_for_slack(paper['summary'])
+            })
         
-        try:
-            response = self.client.chat_postMessage(
-                channel=channel_id,
-                text=text_fallback,
-                blocks=blocks,
-                thread_ts=thread_ts
-            )
-            print(f"Message sent: {response['ts']}")
-            return response['ts']
-        except SlackApiError as e:
-            print(f"Error sending message: {e.response['error']}")
-            return None
+        # Slack用に改行とフォーマットを改善したブロック
+        section = {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": text
+            }
+        }
+        return text_fallback, section
+    
+    def _filter_unposted(self, papers: List[Dict[str, Any]], posted_ids: Set[str]) -> List[Dict[str, Any]]:
+        """通知済みの論文を除いた論文のリストを返す"""
+        new_papers = []
+        for paper in papers:
+            if paper["id"] in posted_ids:
+                logger.info("論文 %s は既に通知済みです。スキップします。", paper['id'])
+            else:
+                new_papers.append(paper)
+        return new_papers
+    
+    def rebuild_posted_index(self) -> Set[str]:
+        """Slackの最新スレッドと突き合わせてローカルのインデックスを補完し、取り込んだ論文IDを返す（--rebuild-seen 用）"""
+        backfilled_ids = {url.split('/')[-1] for url in self._get_latest_parent_paper_urls()}
+        if backfilled_ids:
+            self.posted_index.add(backfilled_ids)
+        return backfilled_ids
+    
+    def _backfill_posted_paper_ids(self, posted_ids: Set[str]) -> Set[str]:
+        """
+        Slackの最新スレッドから通知済みの論文をローカルのインデックスに取り込み、取り込んだ論文IDを返す
+        
+        インデックスが空の場合（初回実行やキャッシュ消失時）のみ行う。
+        それ以外の突き合わせは --rebuild-seen で明示的に行う
+        """
+        if posted_ids:
+            return set()
+        return self.rebuild_posted_index()
+    
+    @_retry_transient_slack_errors
+    def _conversations_history(self, **kwargs) -> SlackResponse:
+        """conversations_history を呼び出す（一時的なエラーは再試行）"""
+        return self.client.conversations_history(**kwargs)
+    
+    @_retry_transient_slack_errors
+    def _conversations_replies(self, **kwargs) -> SlackResponse:
+        """conversations_replies を呼び出す（一時的なエラーは再試行）"""
+        return self.client.conversations_replies(**kwargs)
     
     def _get_latest_parent_paper_urls(self) -> Set[str]:
         """Slack チャンネル内で最新の親投稿のスレッドから、投稿された論文のURLを抽出する"""
         try:
-            # チャンネルの直近20件のメッセージを取得
-            result = self.client.conversations_history(channel=self.slack_channel_id, limit=20)
+            # チャンネルの直近（HISTORY_LOOKBACK_DAYS日以内、最大20件）のメッセージを取得
+            oldest = (datetime.now() - timedelta(days=HISTORY_LOOKBACK_DAYS)).timestamp()
+            result = self._conversations_history(
+                channel=self.slack_channel_id,
+                oldest=str(oldest),
+                limit=20
+            )
             messages = result.get('messages', [])
-            # 親投稿（スレッドの開始投稿）で、「最新のarXiv論文」というテキストが含まれるものを抽出
-            parent_messages = [
-                m for m in messages 
-                if ("📢 *最新のarXiv論文" in m.get('text', ''))
-                and (("thread_ts" not in m) or (m.get('thread_ts') == m.get('ts')))
-            ]
+            parent_messages = [m for m in messages if _is_parent_message(m)]
             if not parent_messages:
                 return set()
             # 最新の親投稿（最も新しいもの）を選ぶ
-            parent_messages.sort(key=lambda m: float(m['ts']), reverse=True)
-            target_message = parent_messages[0]
+            target_message = max(parent_messages, key=lambda m: float(m['ts']))
             
             # 対象の親投稿のスレッド（返信）を取得。親投稿自体は除外する
-            replies_result = self.client.conversations_replies(
+            replies_result = self._conversations_replies(
                 channel=self.slack_channel_id,
                 ts=target_message['ts'],
                 limit=10
             )
             replies = replies_result.get('messages', [])
-            paper_urls = []
-            for msg in replies:
-                if msg.get('ts') == target_message['ts']:
-                    continue  # 親投稿は除外
-                text = msg.get('text', '')
-                # 論文のURLを抽出（フォーマット例："🔗 *URL:* http://arxiv.org/..."）
-                # 正規表現パターンを柔軟にして、URL部分を確実に捕捉できるようにする
-                match = re.search(r"URL:.*?http[s]?://(?:arxiv\.org|[a-zA-Z0-9.-]+)/[^\s\">]+", text)
-                if match:
-                    # URL部分だけを抽出
-                    url_text = match.group(0)
-                    url = re.search(r'http[s]?://[^\s">]+', url_text).group(0)
-                    paper_urls.append(url)
+            # 1つのメッセージに複数の論文が含まれる場合があるため、すべて拾う（親投稿は除外）
+            paper_urls = {
+                url
+                for msg in replies
+                if msg.get('ts') != target_message['ts']
+                for url in _extract_paper_urls(msg.get('text', ''))
+            }
             
-            print(f"Found {len(paper_urls)} existing paper URLs in the latest thread")
-            return set(paper_urls)
+            logger.debug("Found %d existing paper URLs in the latest thread", len(paper_urls))
+            return paper_urls
         except SlackApiError as e:
-            print(f"Error fetching latest parent message: {e.response['error']}")
+            logger.error("Error fetching latest parent message: %s", e.response['error'])
             return set()